@@ -1,97 +1,220 @@
 
+import atexit
 import sqlite3
-from typing import List, Tuple
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
 import streamlit as st
 import pandas as pd
 
+from database import ensure_email_nocase_unique
+
 
 DB_PATH = 'classroom.db'
 
 
-def get_db_connection():
-	conn = sqlite3.connect(DB_PATH)
+@st.cache_resource
+def _db_state() -> Dict[str, Any]:
+	# one long-lived writer connection shared by every session/rerun; Streamlit runs
+	# scripts on several threads, so writes are serialised through `lock`
+	conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
 	conn.row_factory = sqlite3.Row
-	return conn
+	conn.execute('PRAGMA journal_mode=WAL')
+	conn.execute('PRAGMA synchronous=NORMAL')
+	# same integrity rules as database.py's connections: grades must reference a student
+	conn.execute('PRAGMA foreign_keys=ON')
+	conn.execute('PRAGMA temp_store=MEMORY')
+	conn.execute('PRAGMA cache_size=-64000')
+	conn.execute('PRAGMA mmap_size=268435456')
+	# the grades view joins on student_id
+	conn.execute('CREATE INDEX IF NOT EXISTS idx_grades_student_id ON grades(student_id)')
+	# case-insensitive email uniqueness, also for database files created before COLLATE NOCASE;
+	# raises with the clashing emails if the file already holds case variants
+	try:
+		ensure_email_nocase_unique(conn.cursor())
+	except sqlite3.IntegrityError:
+		conn.close()
+		raise
+	# SQLite recommends PRAGMA optimize before closing a long-lived connection
+	atexit.register(conn.execute, 'PRAGMA optimize')
+	# reads go through their own connection: under WAL it only ever sees committed
+	# data, never the rows of a transaction another session has open on `conn`
+	reader = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+	reader.row_factory = sqlite3.Row
+	reader.execute('PRAGMA query_only=ON')
+	reader.execute('PRAGMA temp_store=MEMORY')
+	reader.execute('PRAGMA cache_size=-64000')
+	reader.execute('PRAGMA mmap_size=268435456')
+	# `version` is bumped on every committed write and keys the st.cache_data reads
+	return {'conn': conn, 'lock': threading.Lock(), 'reader': reader, 'read_lock': threading.Lock(), 'version': 0}
+
+
+def get_db_connection() -> sqlite3.Connection:
+	return _db_state()['conn']
+
+
+def read_df(sql: str) -> pd.DataFrame:
+	state = _db_state()
+	with state['read_lock']:
+		return pd.read_sql_query(sql, state['reader'])
+
+
+def read_one(sql: str, params: Tuple = ()) -> sqlite3.Row | None:
+	state = _db_state()
+	with state['read_lock']:
+		return state['reader'].execute(sql, params).fetchone()
+
 
+def db_version() -> Tuple[int, int]:
+	# PRAGMA data_version changes when any other connection (the FastAPI routers,
+	# main.py) commits, so their writes invalidate the cached reads as well
+	state = _db_state()
+	with state['read_lock']:
+		return state['version'], state['reader'].execute('PRAGMA data_version').fetchone()[0]
 
-def fetch_students() -> List[sqlite3.Row]:
-	conn = get_db_connection()
-	cur = conn.cursor()
-	cur.execute('SELECT id, name, email, age FROM students ORDER BY id')
-	rows = cur.fetchall()
-	conn.close()
-	return rows
 
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+	"""Hold the write lock and run the block as one BEGIN IMMEDIATE ... COMMIT."""
+	state = _db_state()
+	conn = state['conn']
+	with state['lock']:
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			yield conn
+		except BaseException:
+			conn.execute('ROLLBACK')
+			raise
+		conn.execute('COMMIT')
+		state['version'] += 1
 
-def fetch_grades() -> List[sqlite3.Row]:
-	conn = get_db_connection()
-	cur = conn.cursor()
-	cur.execute('SELECT id, student_id, score FROM grades ORDER BY id')
-	rows = cur.fetchall()
-	conn.close()
-	return rows
+
+# cached reads take the current db_version() so any committed write, from this app or
+# another process, invalidates them; every write makes a new key, so only the last few
+# versions are kept
+
+@st.cache_data(ttl=None, max_entries=4)
+def fetch_students(version: Tuple[int, int]) -> pd.DataFrame:
+	return read_df('SELECT id, name, email, age FROM students ORDER BY id')
+
+
+@st.cache_data(ttl=None, max_entries=4)
+def fetch_grades_with_names(version: Tuple[int, int]) -> pd.DataFrame:
+	return read_df(
+		"SELECT g.id, g.student_id, COALESCE(s.name, 'Unknown') AS student_name, g.score "
+		'FROM grades g LEFT JOIN students s ON s.id = g.student_id ORDER BY g.id'
+	)
 
 
 def add_student(name: str, email: str, age: int | None):
-	conn = get_db_connection()
-	cur = conn.cursor()
-	try:
-		cur.execute('INSERT INTO students (name, email, age) VALUES (?, ?, ?)', (name, email, age))
-		conn.commit()
+	with transaction() as conn:
+		cur = conn.execute('INSERT INTO students (name, email, age) VALUES (?, ?, ?)', (name, email.strip().lower(), age))
 		return cur.lastrowid
-	except sqlite3.IntegrityError as e:
-		raise
-	finally:
-		conn.close()
 
 
 def update_student(student_id: int, name: str, email: str, age: int | None):
-	conn = get_db_connection()
-	cur = conn.cursor()
-	cur.execute('UPDATE students SET name = ?, email = ?, age = ? WHERE id = ?', (name, email, age, student_id))
-	conn.commit()
-	conn.close()
+	with transaction() as conn:
+		conn.execute('UPDATE students SET name = ?, email = ?, age = ? WHERE id = ?', (name, email.strip().lower(), age, student_id))
 
 
 def delete_student(student_id: int):
-	conn = get_db_connection()
-	cur = conn.cursor()
-	# delete associated grades first (optional)
-	cur.execute('DELETE FROM grades WHERE student_id = ?', (student_id,))
-	cur.execute('DELETE FROM students WHERE id = ?', (student_id,))
-	conn.commit()
-	conn.close()
+	with transaction() as conn:
+		# delete associated grades first (required: foreign keys are enforced)
+		conn.execute('DELETE FROM grades WHERE student_id = ?', (student_id,))
+		conn.execute('DELETE FROM students WHERE id = ?', (student_id,))
 
 
 def add_grade(student_id: int, score: float):
-	conn = get_db_connection()
-	cur = conn.cursor()
-	cur.execute('INSERT INTO grades (student_id, score) VALUES (?, ?)', (student_id, score))
-	conn.commit()
-	last = cur.lastrowid
-	conn.close()
-	return last
+	with transaction() as conn:
+		cur = conn.execute('INSERT INTO grades (student_id, score) VALUES (?, ?)', (student_id, score))
+		return cur.lastrowid
 
 
 def update_grade(grade_id: int, student_id: int, score: float):
-	conn = get_db_connection()
-	cur = conn.cursor()
-	cur.execute('UPDATE grades SET student_id = ?, score = ? WHERE id = ?', (student_id, score, grade_id))
-	conn.commit()
-	conn.close()
+	with transaction() as conn:
+		conn.execute('UPDATE grades SET student_id = ?, score = ? WHERE id = ?', (student_id, score, grade_id))
 
 
 def delete_grade(grade_id: int):
-	conn = get_db_connection()
-	cur = conn.cursor()
-	cur.execute('DELETE FROM grades WHERE id = ?', (grade_id,))
-	conn.commit()
-	conn.close()
+	with transaction() as conn:
+		conn.execute('DELETE FROM grades WHERE id = ?', (grade_id,))
+
+
+@st.cache_data(ttl=None, max_entries=4)
+def students_select_options(version: Tuple[int, int]) -> List[Tuple[int, str]]:
+	df = fetch_students(version)
+	return [(sid, f"{sid}: {name} ({email})")
+			for sid, name, email in zip(df['id'].tolist(), df['name'].tolist(), df['email'].tolist())]
+
 
+# Form/button callbacks: Streamlit runs these before the script reruns, so a submit
+# costs one run instead of the run that handled it plus a forced st.experimental_rerun().
+# Widget values are read from st.session_state by key; the outcome is left in
+# st.session_state['notice'] and rendered by main().
 
-def students_select_options() -> List[Tuple[int, str]]:
-	rows = fetch_students()
-	return [(r['id'], f"{r['id']}: {r['name']} ({r['email']})") for r in rows]
+def _notice(kind: str, message: str):
+	st.session_state['notice'] = (kind, message)
+
+
+def add_student_cb():
+	state = st.session_state
+	try:
+		age = state['add_student_age']
+		add_student(state['add_student_name'].strip(), state['add_student_email'].strip(), None if age == 0 else int(age))
+		_notice('success', 'Student added')
+	except sqlite3.IntegrityError:
+		_notice('error', 'A student with that email already exists')
+	except Exception as e:
+		_notice('error', f'Error adding student: {e}')
+
+
+def update_student_cb(sid: int):
+	state = st.session_state
+	try:
+		age = state[f'update_student_age_{sid}']
+		update_student(sid, state[f'update_student_name_{sid}'].strip(), state[f'update_student_email_{sid}'].strip(),
+					   None if age == 0 else int(age))
+		_notice('success', 'Student updated')
+	except sqlite3.IntegrityError:
+		_notice('error', 'Email already used by another student')
+	except Exception as e:
+		_notice('error', f'Error updating student: {e}')
+
+
+def delete_student_cb(sid: int, del_key: str):
+	try:
+		delete_student(sid)
+		st.session_state.pop(del_key, None)
+		_notice('success', 'Student deleted (and their grades)')
+	except Exception as e:
+		_notice('error', f'Error deleting student: {e}')
+
+
+def add_grade_cb():
+	state = st.session_state
+	try:
+		add_grade(state['add_grade_student'][0], float(state['add_grade_score']))
+		_notice('success', 'Grade added')
+	except Exception as e:
+		_notice('error', f'Error adding grade: {e}')
+
+
+def update_grade_cb(gid: int):
+	state = st.session_state
+	try:
+		update_grade(gid, state[f'update_grade_student_{gid}'][0], float(state[f'update_grade_score_{gid}']))
+		_notice('success', 'Grade updated')
+	except Exception as e:
+		_notice('error', f'Error updating grade: {e}')
+
+
+def delete_grade_cb(gid: int, del_key: str):
+	try:
+		delete_grade(gid)
+		st.session_state.pop(del_key, None)
+		_notice('success', 'Grade deleted')
+	except Exception as e:
+		_notice('error', f'Error deleting grade: {e}')
 
 
 def main():
@@ -99,163 +222,120 @@ def main():
 
 	st.title('Classroom Manager — Students & Grades')
 
+	notice = st.session_state.pop('notice', None)
+	if notice:
+		kind, message = notice
+		getattr(st, kind)(message)
+
 	menu = st.sidebar.selectbox('Choose view', ['Students', 'Grades'])
 
 	if menu == 'Students':
 		st.header('Students')
 
 		# show students
-		students = fetch_students()
-		if students:
-			df_students = pd.DataFrame([[s['id'], s['name'], s['email'], s['age']] for s in students],
-									   columns=['id', 'name', 'email', 'age'])
+		version = db_version()
+		df_students = fetch_students(version)
+		if not df_students.empty:
 			st.dataframe(df_students, use_container_width=True)
 		else:
 			st.info('No students found')
 
 		st.subheader('Add student')
 		with st.form('add_student'):
-			name = st.text_input('Name')
-			email = st.text_input('Email')
-			age = st.number_input('Age', min_value=0, max_value=200, step=1, value=0)
-			submitted = st.form_submit_button('Add')
-			if submitted:
-				try:
-					age_val = None if age == 0 else int(age)
-					add_student(name.strip(), email.strip(), age_val)
-					st.success('Student added')
-					st.experimental_rerun()
-				except sqlite3.IntegrityError:
-					st.error('A student with that email already exists')
-				except Exception as e:
-					st.error(f'Error adding student: {e}')
+			st.text_input('Name', key='add_student_name')
+			st.text_input('Email', key='add_student_email')
+			st.number_input('Age', min_value=0, max_value=200, step=1, value=0, key='add_student_age')
+			st.form_submit_button('Add', on_click=add_student_cb)
 
 		st.subheader('Update / Delete student')
-		opts = students_select_options()
+		opts = students_select_options(version)
 		if opts:
 			sel = st.selectbox('Select student', options=opts, format_func=lambda x: x[1])
 			sid = sel[0]
+			# widget / session_state keys for this student, formatted once per run
+			del_key = f'confirm_delete_student_{sid}'
+			prompt_key = f'delete_prompt_{sid}'
+			confirm_key = f'confirm_delete_{sid}'
+			cancel_key = f'cancel_delete_{sid}'
 			# fetch current
-			conn = get_db_connection()
-			cur = conn.cursor()
-			cur.execute('SELECT id, name, email, age FROM students WHERE id = ?', (sid,))
-			row = cur.fetchone()
-			conn.close()
+			row = read_one('SELECT id, name, email, age FROM students WHERE id = ?', (sid,))
 
 			if row:
 				with st.form('update_student'):
-					name_u = st.text_input('Name', value=row['name'])
-					email_u = st.text_input('Email', value=row['email'])
-					age_u = st.number_input('Age', min_value=0, max_value=200, step=1, value=(row['age'] or 0))
-					upd = st.form_submit_button('Update')
-					if upd:
-						try:
-							age_val = None if age_u == 0 else int(age_u)
-							update_student(sid, name_u.strip(), email_u.strip(), age_val)
-							st.success('Student updated')
-							st.experimental_rerun()
-						except sqlite3.IntegrityError:
-							st.error('Email already used by another student')
-						except Exception as e:
-							st.error(f'Error updating student: {e}')
+					st.text_input('Name', value=row['name'], key=f'update_student_name_{sid}')
+					st.text_input('Email', value=row['email'], key=f'update_student_email_{sid}')
+					st.number_input('Age', min_value=0, max_value=200, step=1, value=(row['age'] or 0),
+									key=f'update_student_age_{sid}')
+					st.form_submit_button('Update', on_click=update_student_cb, args=(sid,))
 
 				# Delete flow: require an explicit confirm click (uses session_state)
-				if st.button('Delete student', key=f'delete_prompt_{sid}'):
-					st.session_state[f'confirm_delete_student_{sid}'] = True
+				if st.button('Delete student', key=prompt_key):
+					st.session_state[del_key] = True
 
-				if st.session_state.get(f'confirm_delete_student_{sid}'):
+				if st.session_state.get(del_key):
 					st.warning('This will delete the student and all their grades.')
-					if st.button('Confirm delete', key=f'confirm_delete_{sid}'):
-						try:
-							delete_student(sid)
-							st.success('Student deleted (and their grades)')
-							# clear state and refresh
-							st.session_state.pop(f'confirm_delete_student_{sid}', None)
-							st.experimental_rerun()
-						except Exception as e:
-							st.error(f'Error deleting student: {e}')
-					if st.button('Cancel', key=f'cancel_delete_{sid}'):
-						st.session_state.pop(f'confirm_delete_student_{sid}', None)
+					st.button('Confirm delete', key=confirm_key, on_click=delete_student_cb, args=(sid, del_key))
+					if st.button('Cancel', key=cancel_key):
+						st.session_state.pop(del_key, None)
 						st.info('Delete canceled')
 		else:
 			st.info('No students to select')
 
 	else:  # Grades
 		st.header('Grades')
-		grades = fetch_grades()
-		students = fetch_students()
-		student_map = {s['id']: s['name'] for s in students}
+		version = db_version()
+		df_grades = fetch_grades_with_names(version)
+		df_students = fetch_students(version)
+		student_opts = [(sid, f"{sid}: {name}") for sid, name in zip(df_students['id'].tolist(), df_students['name'].tolist())]
 
-		if grades:
-			df_grades = pd.DataFrame([[g['id'], g['student_id'], student_map.get(g['student_id'], 'Unknown'), g['score']] for g in grades],
-									 columns=['id', 'student_id', 'student_name', 'score'])
+		if not df_grades.empty:
 			st.dataframe(df_grades, use_container_width=True)
 		else:
 			st.info('No grades found')
 
 		st.subheader('Add grade')
 		with st.form('add_grade'):
-			student_opts = [(s['id'], f"{s['id']}: {s['name']}") for s in students]
 			if student_opts:
-				sel = st.selectbox('Student', options=student_opts, format_func=lambda x: x[1])
-				student_id = sel[0]
-				score = st.number_input('Score', min_value=0.0, max_value=100.0, value=0.0, step=0.1)
-				added = st.form_submit_button('Add Grade')
-				if added:
-					try:
-						add_grade(student_id, float(score))
-						st.success('Grade added')
-						st.experimental_rerun()
-					except Exception as e:
-						st.error(f'Error adding grade: {e}')
+				st.selectbox('Student', options=student_opts, format_func=lambda x: x[1], key='add_grade_student')
+				st.number_input('Score', min_value=0.0, max_value=100.0, value=0.0, step=0.1, key='add_grade_score')
+				st.form_submit_button('Add Grade', on_click=add_grade_cb)
 			else:
 				st.info('No students available — add students first')
 
 		st.subheader('Update / Delete grade')
-		if grades:
-			grade_opts = [(g['id'], f"{g['id']}: student {g['student_id']} — {g['score']}") for g in grades]
+		if not df_grades.empty:
+			grade_opts = [(gid, f"{gid}: student {sid} — {score}")
+						  for gid, sid, score in zip(df_grades['id'].tolist(), df_grades['student_id'].tolist(), df_grades['score'].tolist())]
 			selg = st.selectbox('Select grade', options=grade_opts, format_func=lambda x: x[1])
 			gid = selg[0]
-			conn = get_db_connection()
-			cur = conn.cursor()
-			cur.execute('SELECT id, student_id, score FROM grades WHERE id = ?', (gid,))
-			grow = cur.fetchone()
-			conn.close()
+			# the confirm flag must not share a key with the confirm button widget
+			del_key = f'confirm_delete_grade_{gid}'
+			prompt_key = f'delete_grade_prompt_{gid}'
+			confirm_key = f'confirm_delete_grade_btn_{gid}'
+			cancel_key = f'cancel_delete_grade_{gid}'
+			grow = read_one('SELECT id, student_id, score FROM grades WHERE id = ?', (gid,))
 
 			if grow:
 				with st.form('update_grade'):
-					stu_opts = [(s['id'], f"{s['id']}: {s['name']}") for s in students]
 					# default the selectbox to the grade's current student
 					default_index = 0
-					for i, opt in enumerate(stu_opts):
+					for i, opt in enumerate(student_opts):
 						if opt[0] == grow['student_id']:
 							default_index = i
-					selstu = st.selectbox('Student', options=stu_opts, index=default_index, format_func=lambda x: x[1])
-					score_u = st.number_input('Score', min_value=0.0, max_value=100.0, value=float(grow['score']), step=0.1)
-					upg = st.form_submit_button('Update Grade')
-					if upg:
-						try:
-							update_grade(gid, selstu[0], float(score_u))
-							st.success('Grade updated')
-							st.experimental_rerun()
-						except Exception as e:
-							st.error(f'Error updating grade: {e}')
-
-				if st.button('Delete grade', key=f'delete_grade_prompt_{gid}'):
-					st.session_state[f'confirm_delete_grade_{gid}'] = True
-
-				if st.session_state.get(f'confirm_delete_grade_{gid}'):
+					st.selectbox('Student', options=student_opts, index=default_index, format_func=lambda x: x[1],
+								 key=f'update_grade_student_{gid}')
+					st.number_input('Score', min_value=0.0, max_value=100.0, value=float(grow['score']), step=0.1,
+									key=f'update_grade_score_{gid}')
+					st.form_submit_button('Update Grade', on_click=update_grade_cb, args=(gid,))
+
+				if st.button('Delete grade', key=prompt_key):
+					st.session_state[del_key] = True
+
+				if st.session_state.get(del_key):
 					st.warning('This will permanently delete the selected grade.')
-					if st.button('Confirm delete grade', key=f'confirm_delete_grade_{gid}'):
-						try:
-							delete_grade(gid)
-							st.success('Grade deleted')
-							st.session_state.pop(f'confirm_delete_grade_{gid}', None)
-							st.experimental_rerun()
-						except Exception as e:
-							st.error(f'Error deleting grade: {e}')
-					if st.button('Cancel', key=f'cancel_delete_grade_{gid}'):
-						st.session_state.pop(f'confirm_delete_grade_{gid}', None)
+					st.button('Confirm delete grade', key=confirm_key, on_click=delete_grade_cb, args=(gid, del_key))
+					if st.button('Cancel', key=cancel_key):
+						st.session_state.pop(del_key, None)
 						st.info('Delete canceled')
 		else:
 			st.info('No grades to select')
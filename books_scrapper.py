@@ -1,15 +1,16 @@
 import csv
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 import re
 
+# compiled once at import; both helpers run for every grade cell of every row
+_NUM_RE = re.compile(r'[-+]?\d*\.?\d+')
+_SEP_RE = re.compile(r'\s*[;,|/]\s*')
+
 def _parse_score(s: Optional[str]) -> Optional[float]:
     if not s:
         return None
-    s = s.strip()
-    if s == '':
-        return None
     # extract first numeric substring (handles values like "[9]", "88%", " 7.5 ", etc.)
-    m = re.search(r'[-+]?\d*\.?\d+', s)
+    m = _NUM_RE.search(s)
     if not m:
         return None
     try:
@@ -20,75 +21,87 @@ def _parse_score(s: Optional[str]) -> Optional[float]:
 def _split_multi(value: Optional[str]) -> List[str]:
     if not value:
         return []
-    parts = re.split(r'\s*[;,|/]\s*', value)
-    return [p.strip() for p in parts if p.strip()]
+    # the separator pattern already swallows surrounding whitespace, so only the ends need stripping
+    return [p for p in _SEP_RE.split(value.strip()) if p]
 
-def scrape_students_from_csv(file_path: str) -> Dict[str, List[Dict]]:
+def _first_value(row: List[str], cols: List[int]) -> str:
+    # first non-empty cell among the candidate column indices (rows may be short)
+    for i in cols:
+        if i < len(row):
+            v = row[i].strip()
+            if v:
+                return v
+    return ''
+
+def iter_students_and_grades(file_path: str) -> Iterator[Tuple[str, Dict]]:
     """
-    Read a CSV file (e.g. dummy_students.csv) and return {'students', 'grades'}.
-    Supports flexible headers: 'name', 'student', 'full name'; 'grade', 'score', 'grades'; 'email'; 'age'.
-    Multiple grades per cell may be separated by , ; | or /.
+    Stream a CSV file (e.g. dummy_students.csv) as ('student', row) and ('grade', row) records.
+    Students get 1-based ids in first-seen order and are yielded before any grade that references them.
+    Headers and grade cells are handled as in scrape_students_from_csv. A later duplicate row can only
+    fill in a missing age on the already-yielded student dict, so consumers that persist students
+    immediately keep the first row's values.
     """
     with open(file_path, newline='', encoding='utf-8') as fh:
-        reader = csv.DictReader(fh)
-        rows = list(reader)
+        reader = csv.reader(fh)
+        header = next(reader, [])
 
-    students_map = {}  # key -> {'name', 'email', 'age'}
-    grades_temp = []  # entries with student_key and score
+        # resolve header names to column indices once (a later duplicate header wins, as with DictReader)
+        col = {h.strip().lower(): i for i, h in enumerate(header)}
+        name_cols = [col[k] for k in ('name', 'student', 'full name') if k in col]
+        email_cols = [col[k] for k in ('email',) if k in col]
+        age_cols = [col[k] for k in ('age',) if k in col]
+        grade_cols = [col[k] for k in ('grades', 'grade', 'score') if k in col]
 
-    for row in rows:
-        norm = {k.strip().lower(): (v.strip() if v is not None else '') for k, v in row.items()}
+        students_map = {}  # key -> student record
 
-        name = norm.get('name') or norm.get('student') or norm.get('full name') or ''
-        email = norm.get('email') or ''
-        age_raw = norm.get('age') or ''
-        grades_cell = norm.get('grades') or norm.get('grade') or norm.get('score') or ''
+        for row in reader:
+            if not row:
+                continue  # blank line
 
-        grade_vals = _split_multi(grades_cell)
+            name = _first_value(row, name_cols)
+            # normalised once here so dedup and the NOCASE unique index see one spelling
+            email = _first_value(row, email_cols).lower()
+            age_raw = _first_value(row, age_cols)
+            grades_cell = _first_value(row, grade_cols)
 
-        try:
-            age = int(age_raw) if age_raw else None
-        except Exception:
-            age = None
+            try:
+                age = int(age_raw) if age_raw else None
+            except Exception:
+                age = None
 
-        key = (name or f'unknown_{len(students_map)+1}', email or '')
+            key = (name or f'unknown_{len(students_map)+1}', email or '')
 
-        if key not in students_map:
-            students_map[key] = {
-                'name': name,
-                'email': email,
-                'age': age
-            }
-        else:
-            if students_map[key]['age'] is None and age is not None:
-                students_map[key]['age'] = age
+            student = students_map.get(key)
+            if student is None:
+                student = {
+                    'id': len(students_map) + 1,
+                    'name': name,
+                    'email': email,
+                    'age': age
+                }
+                students_map[key] = student
+                yield 'student', student
+            elif student['age'] is None and age is not None:
+                student['age'] = age
 
-        # collect grades (each grade value becomes a separate grade record)
-        for gv in grade_vals:
-            score = _parse_score(gv)
-            grades_temp.append({'student_key': key, 'score': score, 'feedback': None})
+            # each grade value becomes a separate grade record (no class_id, no feedback)
+            for gv in _split_multi(grades_cell):
+                yield 'grade', {'student_id': student['id'], 'score': _parse_score(gv)}
 
-    # build students list with new ids
+def scrape_students_from_csv(file_path: str) -> Dict[str, List[Dict]]:
+    """
+    Read a CSV file (e.g. dummy_students.csv) and return {'students', 'grades'}.
+    Supports flexible headers: 'name', 'student', 'full name'; 'grade', 'score', 'grades'; 'email'; 'age'.
+    Multiple grades per cell may be separated by , ; | or /.
+    Use iter_students_and_grades to stream the same records without materialising both lists.
+    """
     students_list = []
-    key_to_new_id = {}
-    for i, (key, data) in enumerate(students_map.items(), start=1):
-        key_to_new_id[key] = i
-        students_list.append({
-            'id': i,
-            'name': data['name'],
-            'email': data['email'],
-            'age': data['age']
-        })
-
-    # remap grades to use new student ids (no class_id, no feedback)
     grades_list = []
-    for g in grades_temp:
-        new_sid = key_to_new_id.get(g['student_key'])
-        if new_sid:
-            grades_list.append({
-                'student_id': new_sid,
-                'score': g['score']
-            })
+    for kind, record in iter_students_and_grades(file_path):
+        if kind == 'student':
+            students_list.append(record)
+        else:
+            grades_list.append(record)
 
     return {'students': students_list, 'grades': grades_list}
 
@@ -1,19 +1,20 @@
 from faker import Faker
+import numpy as np
 import pandas as pd
 
 fake = Faker()
 
-data = [
-    {
-        'name': fake.name(),
-        'email': fake.unique.email(),
-        'age': fake.random_int(min=14, max=18),
-        'student_id': fake.unique.random_number(digits=5),
-        'score': [fake.random_int(min=1, max=10) ]
-    }
-    for _ in range(50)
-]
+n = 50
+
+# only the text columns need Faker per row; numeric columns are generated as whole arrays
+data = {
+    'name': [fake.name() for _ in range(n)],
+    'email': [fake.unique.email() for _ in range(n)],
+    'age': np.random.randint(14, 19, size=n),
+    'student_id': np.random.choice(90000, size=n, replace=False) + 10000,
+    'score': np.random.randint(1, 11, size=(n, 1)).tolist(),  # one-element lists, written as "[7]"
+}
 
 
 df=pd.DataFrame(data)
-df.to_csv('dummy_students.csv', index=False)
\ No newline at end of file
+df.to_csv('dummy_students.csv', index=False)
@@ -1,32 +1,50 @@
-from books_scrapper import scrape_students_from_csv
-from models.student import StudentCreate
-from models.grade import GradeCreate
-from database import insert_data
-from typing import List
+from books_scrapper import iter_students_and_grades
+from database import insert_data_batches
+from itertools import islice
+from typing import List, Optional, Tuple
 import sqlite3
 
-# read CSV and prepare models, then insert into DB
-parsed = scrape_students_from_csv('dummy_students.csv')
-
-students_payload: List[StudentCreate] = []
-for s in parsed.get('students', []):
-    students_payload.append(StudentCreate(name=s['name'], email=s['email'], age=s.get('age')))
-
-grades_payload: List[GradeCreate] = []
-# grades in parsed are student_id (local id) and score; we need to map to eventual DB student ids.
-# The database.insert_data will insert students first (in same order), so parsed student ids map to insert order.
-for g in parsed.get('grades', []):
-    score = g.get('score')
-    if score is None:
-        continue  # skip invalid/missing scores
-    try:
-        score_val = float(score)
-    except Exception:
-        continue
-    grades_payload.append(GradeCreate(student_id=g['student_id'], score=score_val))
+CSV_PATH = 'dummy_students.csv'
+CHUNK_SIZE = 10000  # parsed records per insert batch
 
+
+def iter_batches(records):
+    # stream the CSV batch by batch, so memory stays bounded by CHUNK_SIZE
+    ageless = []  # students inserted without an age; a later duplicate row may fill it in
+    while True:
+        chunk = list(islice(records, CHUNK_SIZE))
+        if not chunk:
+            break
+
+        # plain tuples for the bulk INSERTs; validation is left to the schema
+        students_payload: List[Tuple[str, str, Optional[int]]] = []
+        grades_payload: List[Tuple[int, float]] = []
+        for kind, rec in chunk:
+            if kind == 'student':
+                students_payload.append((rec['name'], rec['email'], rec.get('age')))
+                if rec.get('age') is None:
+                    ageless.append(rec)
+                continue
+            score = rec.get('score')
+            if score is None:
+                continue  # skip invalid/missing scores
+            try:
+                score_val = float(score)
+            except Exception:
+                continue
+            grades_payload.append((rec['student_id'], score_val))
+
+        yield students_payload, grades_payload, []
+
+    # ages are final once the whole file has been read
+    yield [], [], [(rec['age'], rec['email']) for rec in ageless if rec['age'] is not None]
+
+
+# grades carry parsed student ids (1-based, in first-seen order); every batch goes into
+# one transaction, so later batches can still map earlier students and a failed load
+# leaves nothing behind.
 try:
-    insert_data(students_payload, grades_payload)
+    insert_data_batches(iter_batches(iter_students_and_grades(CSV_PATH)))
     print("Inserted students and grades into classroom.db")
 except sqlite3.IntegrityError as e:
     # likely rerun where unique emails already exist
@@ -1,7 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
 class GradeBase(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     student_id: int
     score: float
 
@@ -1,9 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
 
 
 class StudentBase(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+
     name: str
     email: str
     age: Optional[int] = None   
@@ -21,4 +23,3 @@ class StudentResponse(StudentBase):
 
 class Student(StudentBase):
     id: int
-    id: int
@@ -3,34 +3,26 @@ from typing import List
 from fastapi import APIRouter, HTTPException, status, Depends
 
 from models.grade import Grade, GradeCreate
-from database import get_db_connection
+from database import _INSERT_GRADE_SQL, get_db_connection
 from auth.security import get_api_key
 
 router = APIRouter()
 
+_SELECT_GRADES_SQL = "SELECT id, student_id, score FROM grades"
+_UPDATE_GRADE_SQL = "UPDATE grades SET student_id = ?, score = ? WHERE id = ?"
+_DELETE_GRADE_SQL = "DELETE FROM grades WHERE id = ?"
+
 
 # ---------------------------------------------------------
 # GET ALL GRADES
 # ---------------------------------------------------------
 @router.get("/", response_model=List[Grade])
 def get_grades():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT id, student_id, score FROM grades"
-    )
-    grades = cursor.fetchall()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
 
-    return [
-        {
-            "id": grade[0],
-            "student_id": grade[1],
-            "score": grade[2]
-        }
-        for grade in grades
-    ]
+        cursor.execute(_SELECT_GRADES_SQL)
+        return [dict(row) for row in cursor]
 
 
 # ---------------------------------------------------------
@@ -38,29 +30,24 @@ def get_grades():
 # ---------------------------------------------------------
 @router.post("/", response_model=Grade)
 def create_grade(grade: GradeCreate, _: str = Depends(get_api_key)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection(write=True) as conn:
+        cursor = conn.cursor()
 
-    try:
-        cursor.execute(
-            "INSERT INTO grades (student_id, score) "
-            "VALUES (?, ?)",
-            (grade.student_id, grade.score),
-        )
-
-        conn.commit()
-        grade_id = cursor.lastrowid
-        return Grade(id=grade_id, **grade.dict())
+        try:
+            cursor.execute(
+                _INSERT_GRADE_SQL,
+                (grade.student_id, grade.score),
+            )
 
-    except sqlite3.IntegrityError:
-        conn.close()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid student_id"
-        )
+            conn.commit()
+            grade_id = cursor.lastrowid
+            return Grade(id=grade_id, **grade.model_dump())
 
-    finally:
-        conn.close()
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid student_id"
+            )
 
 
 # ---------------------------------------------------------
@@ -68,23 +55,26 @@ def create_grade(grade: GradeCreate, _: str = Depends(get_api_key)):
 # ---------------------------------------------------------
 @router.put("/{grade_id}", response_model=Grade)
 def update_grade(grade_id: int, grade: GradeCreate, _: str = Depends(get_api_key)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection(write=True) as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                _UPDATE_GRADE_SQL,
+                (grade.student_id, grade.score, grade_id),
+            )
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid student_id"
+            )
+
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Grade not found")
 
-    cursor.execute(
-        "UPDATE grades SET student_id = ?, score = ? "
-        "WHERE id = ?",
-        (grade.student_id, grade.score, grade_id),
-    )
-
-    if cursor.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Grade not found")
-
-    conn.commit()
-    conn.close()
+        conn.commit()
 
-    return Grade(id=grade_id, **grade.dict())
+    return Grade(id=grade_id, **grade.model_dump())
 
 
 # ---------------------------------------------------------
@@ -92,16 +82,14 @@ def update_grade(grade_id: int, grade: GradeCreate, _: str = Depends(get_api_key
 # ---------------------------------------------------------
 @router.delete("/{grade_id}", response_model=dict)
 def delete_grade(grade_id: int, _: str = Depends(get_api_key)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection(write=True) as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("DELETE FROM grades WHERE id = ?", (grade_id,))
+        cursor.execute(_DELETE_GRADE_SQL, (grade_id,))
 
-    if cursor.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Grade not found")
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Grade not found")
 
-    conn.commit()
-    conn.close()
+        conn.commit()
 
-    return {"detail": "Grade deleted"}
\ No newline at end of file
+    return {"detail": "Grade deleted"}
@@ -3,92 +3,87 @@ from typing import List
 from fastapi import APIRouter, HTTPException, status, Depends
 
 from models.student import Student, StudentCreate
-from database import get_db_connection
+from database import _INSERT_STUDENT_SQL, get_db_connection
 from auth.security import get_api_key
 
 router = APIRouter()
 
+_SELECT_STUDENTS_SQL = "SELECT id, name, email, age FROM students"
+_UPDATE_STUDENT_SQL = "UPDATE students SET name = ?, email = ?, age = ? WHERE id = ?"
+_DELETE_STUDENT_SQL = "DELETE FROM students WHERE id = ?"
+_DELETE_STUDENT_GRADES_SQL = "DELETE FROM grades WHERE student_id = ?"
+
 
 @router.get("/", response_model=List[Student])
 def get_students():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id, name, email, age FROM students")
-    students = cursor.fetchall()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
 
-    return [
-        {
-            "id": student[0],
-            "name": student[1],
-            "email": student[2],
-            "age": student[3],
-        }
-        for student in students
-    ]
+        cursor.execute(_SELECT_STUDENTS_SQL)
+        return [dict(row) for row in cursor]
 
 
 @router.post("/", response_model=Student)
 def create_student(student: StudentCreate, _: str = Depends(get_api_key)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    student = student.model_copy(update={'email': student.email.strip().lower()})
+    with get_db_connection(write=True) as conn:
+        cursor = conn.cursor()
 
-    try:
-        cursor.execute(
-            "INSERT INTO students (name, email, age) "
-            "VALUES (?, ?, ?)",
-            (student.name, student.email, student.age),
-        )
-
-        conn.commit()
-        student_id = cursor.lastrowid
-        return Student(id=student_id, **student.dict())
+        try:
+            cursor.execute(
+                _INSERT_STUDENT_SQL,
+                (student.name, student.email, student.age),
+            )
 
-    except sqlite3.IntegrityError:
-        conn.close()
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"The student '{student.name}' already exists."
-        )
+            conn.commit()
+            student_id = cursor.lastrowid
+            return Student(id=student_id, **student.model_dump())
 
-    finally:
-        conn.close()
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"The student '{student.name}' already exists."
+            )
 
 
 @router.put("/{student_id}", response_model=Student)
 def update_student(student_id: int, student: StudentCreate, _: str = Depends(get_api_key)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    student = student.model_copy(update={'email': student.email.strip().lower()})
+    with get_db_connection(write=True) as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(
+                _UPDATE_STUDENT_SQL,
+                (student.name, student.email, student.age, student_id),
+            )
+        except sqlite3.IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"A student with the email '{student.email}' already exists."
+            )
+
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Student not found")
 
-    cursor.execute(
-        "UPDATE students SET name = ?, email = ?, age = ? "
-        "WHERE id = ?",
-        (student.name, student.email, student.age, student_id),
-    )
-
-    if cursor.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    conn.commit()
-    conn.close()
+        conn.commit()
 
-    return Student(id=student_id, **student.dict())
+    return Student(id=student_id, **student.model_dump())
 
 
 @router.delete("/{student_id}", response_model=dict)
 def delete_student(student_id: int, _: str = Depends(get_api_key)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection(write=True) as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
+        # foreign keys are enforced, so the student's grades go first (same transaction;
+        # rolled back with it if the student does not exist)
+        cursor.execute(_DELETE_STUDENT_GRADES_SQL, (student_id,))
+        cursor.execute(_DELETE_STUDENT_SQL, (student_id,))
 
-    if cursor.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Student not found")
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Student not found")
 
-    conn.commit()
-    conn.close()
+        conn.commit()
 
-    return {"detail": "Student deleted"}
\ No newline at end of file
+    return {"detail": "Student deleted"}